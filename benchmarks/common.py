@@ -0,0 +1,68 @@
+"""Helpers shared by the benchmarks: local stand-in servers and a gatekeeper."""
+import socket
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from starlette.middleware.sessions import SessionMiddleware
+
+from app.custom_routes import ProxyConfig, add_routes
+
+USER = {
+    "name": "Professor",
+    "email": "professor@planetexpress.com",
+    "groups": ["admin_staff"],
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve(app: FastAPI, port: int | None = None, uds: str | None = None):
+    server = uvicorn.Server(
+        uvicorn.Config(
+            app, host="127.0.0.1", port=port or 0, uds=uds, log_level="warning"
+        )
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def upstream_app(size: int) -> FastAPI:
+    """Stand-in upstream returning `size` bytes from `/blob`."""
+    app = FastAPI()
+    body = b"x" * size
+
+    @app.get("/blob")
+    async def blob():
+        return Response(body, media_type="application/octet-stream")
+
+    return app
+
+
+def gatekeeper_app(config: ProxyConfig) -> FastAPI:
+    """Gatekeeper with the given routes and a `/bench-login` to get a session."""
+    app = FastAPI()
+    app.add_middleware(SessionMiddleware, secret_key="benchmark")  # nosec: B106
+
+    @app.get("/bench-login")
+    async def bench_login(request: Request):
+        request.session["user"] = USER
+        return {}
+
+    return add_routes(app, config)
+
+
+def upstream_config(url: str, slug: str, **kwargs) -> dict:
+    return {
+        "url": url,
+        "slug": slug,
+        "uris": {"/*": {"methods": ["GET"], "roles": ["admin_staff"]}},
+        **kwargs,
+    }
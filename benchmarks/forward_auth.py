@@ -0,0 +1,90 @@
+#! /usr/bin/env python3
+"""
+Compare full proxying (`transparent_proxy`) with forward auth mode.
+
+Spins up a local stand-in upstream serving a large body and a gatekeeper with
+both the proxied route and `/_auth`. In forward auth mode the client asks
+`/_auth` and then fetches the body from the upstream directly, which is what
+an edge proxy (nginx/Traefik) would do.
+
+    PYTHONPATH=src python benchmarks/forward_auth.py --size-mb 16 --requests 50
+"""
+import argparse
+import asyncio
+import time
+
+from httpx import AsyncClient
+
+from app.custom_routes import ProxyConfig
+from app.forward_auth import add_forward_auth
+from common import free_port, gatekeeper_app, serve, upstream_app, upstream_config
+
+
+async def run(gatekeeper: str, upstream: str, requests: int, concurrency: int):
+    async with AsyncClient(base_url=gatekeeper, timeout=60) as client:
+        await client.get("/bench-login")
+        async with AsyncClient(base_url=upstream, timeout=60) as edge:
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def proxied():
+                async with semaphore:
+                    res = await client.get("/bench/blob")
+                    res.raise_for_status()
+                    return len(res.content)
+
+            async def forward_auth():
+                async with semaphore:
+                    auth = await client.get(
+                        "/_auth",
+                        headers={
+                            "X-Forwarded-Uri": "/bench/blob",
+                            "X-Forwarded-Method": "GET",
+                        },
+                    )
+                    auth.raise_for_status()
+                    res = await edge.get("/blob")
+                    res.raise_for_status()
+                    return len(res.content)
+
+            for name, fn in (("proxy", proxied), ("forward_auth", forward_auth)):
+                await fn()  # warm up connections and caches
+                start = time.perf_counter()
+                sizes = await asyncio.gather(*(fn() for _ in range(requests)))
+                elapsed = time.perf_counter() - start
+                mb = sum(sizes) / 2**20
+                print(
+                    f"{name:>14}: {requests / elapsed:8.1f} req/s  "
+                    f"{mb / elapsed:8.1f} MiB/s  ({elapsed:.2f}s)"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-mb", type=float, default=8)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--cache-ttl", type=float, default=5.0)
+    args = parser.parse_args()
+
+    from loguru import logger
+
+    logger.remove()  # per-request logging would dominate the timings
+
+    upstream_port, gatekeeper_port = free_port(), free_port()
+    upstream = f"http://127.0.0.1:{upstream_port}"
+    serve(upstream_app(int(args.size_mb * 2**20)), upstream_port)
+    config = ProxyConfig(upstreams=[upstream_config(upstream, "bench")])
+    gatekeeper = add_forward_auth(gatekeeper_app(config), config, ttl=args.cache_ttl)
+    serve(gatekeeper, gatekeeper_port)
+    asyncio.run(
+        run(
+            f"http://127.0.0.1:{gatekeeper_port}",
+            upstream,
+            args.requests,
+            args.concurrency,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#! /usr/bin/env python3
+"""
+Compare upstream transports: HTTP/1.1 over TCP, Unix domain socket and h2.
+
+Spins up local stand-in upstreams (uvicorn over TCP and a Unix socket, and
+hypercorn speaking h2c over TCP and a Unix socket if it's installed) behind a
+single gatekeeper and
+drives the same request load through each route.
+
+    PYTHONPATH=src python benchmarks/transports.py --size-kb 4 --requests 2000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import threading
+import time
+
+from httpx import AsyncClient
+
+from app.custom_routes import ProxyConfig
+from common import free_port, gatekeeper_app, serve, upstream_app, upstream_config
+
+
+def serve_h2c(app, *bind: str) -> bool:
+    """Serve `app` with hypercorn, which accepts h2c prior knowledge."""
+    try:
+        from hypercorn.asyncio import serve as hypercorn_serve
+        from hypercorn.config import Config
+    except ImportError:
+        print("hypercorn not installed, skipping h2")
+        return False
+
+    config = Config()
+    config.bind = list(bind)
+    config.loglevel = "WARNING"
+    # A shutdown trigger stops hypercorn installing signal handlers, which only
+    # works on the main thread. The daemon thread dies with the benchmark.
+    serving = hypercorn_serve(app, config, shutdown_trigger=asyncio.Event().wait)
+    threading.Thread(target=asyncio.run, args=(serving,), daemon=True).start()
+    time.sleep(0.5)
+    return True
+
+
+async def run(gatekeeper: str, slugs: list[str], requests: int, concurrency: int):
+    async with AsyncClient(base_url=gatekeeper, timeout=60) as client:
+        await client.get("/bench-login")
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(slug: str) -> int:
+            async with semaphore:
+                res = await client.get(f"/{slug}/blob")
+                res.raise_for_status()
+                return len(res.content)
+
+        for slug in slugs:
+            await fetch(slug)  # warm up the pooled upstream client
+            start = time.perf_counter()
+            await asyncio.gather(*(fetch(slug) for _ in range(requests)))
+            elapsed = time.perf_counter() - start
+            print(
+                f"{slug:>5}: {requests / elapsed:8.1f} req/s  "
+                f"{elapsed / requests * 1000:6.2f} ms/req  ({elapsed:.2f}s)"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-kb", type=float, default=4)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    from loguru import logger
+
+    logger.remove()  # per-request logging would dominate the timings
+
+    upstream = upstream_app(int(args.size_kb * 2**10))
+    tcp_port, h2_port, gatekeeper_port = free_port(), free_port(), free_port()
+    sock = os.path.join(tempfile.mkdtemp(), "upstream.sock")
+    h2_sock = os.path.join(tempfile.mkdtemp(), "upstream-h2.sock")
+    serve(upstream, port=tcp_port)
+    serve(upstream, uds=sock)
+
+    upstreams = [
+        upstream_config(f"http://127.0.0.1:{tcp_port}", "tcp"),
+        upstream_config(f"unix://{sock}", "uds"),
+    ]
+    if serve_h2c(upstream, f"127.0.0.1:{h2_port}", f"unix:{h2_sock}"):
+        upstreams += [
+            upstream_config(f"http://127.0.0.1:{h2_port}", "h2", http2=True),
+            upstream_config(f"unix://{h2_sock}", "h2uds", http2=True),
+        ]
+
+    config = ProxyConfig(upstreams=upstreams)
+    serve(gatekeeper_app(config), port=gatekeeper_port)
+    asyncio.run(
+        run(
+            f"http://127.0.0.1:{gatekeeper_port}",
+            [u["slug"] for u in upstreams],
+            args.requests,
+            args.concurrency,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
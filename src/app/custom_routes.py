@@ -3,9 +3,11 @@ from typing import Any, Callable, List, Optional
 import yaml
 from fastapi import Depends, FastAPI, HTTPException, Request
 from pydantic import BaseModel, validator
+from starlette.routing import compile_path
 
 from app.proxy import transparent_proxy
 from app.routes import get_current_user
+from app.tracing import span
 
 from pathlib import Path
 from loguru import logger
@@ -34,8 +36,9 @@ class URIRule(BaseModel):
 class Upstream(BaseModel):
     """Information about an upstream service to proxy to."""
 
-    url: str  # The address of the remote service.
+    url: str  # The address of the remote service, or `unix:///path.sock`.
     slug: Optional[str] = None  # Optional identifier for the service.
+    http2: bool = False  # Opt-in HTTP/2 to the upstream.
     uris: dict[str, URIRule]  # Mapping of path to rules.
 
     @validator("slug", pre=True, always=True)
@@ -87,21 +90,34 @@ def require_specific_user(users: List[str], raise_exception: bool = True):
     return _inner
 
 
+def is_user_authorised(
+    user: dict, roles: Optional[List[str]] = None, users: Optional[List[str]] = None
+) -> bool:
+    """Check a user against the roles and users of a rule without raising.
+
+    Any authenticated user is allowed if the rule lists neither. Otherwise the
+    user must match one of the checks the rule actually specifies.
+    """
+    logger.info(f"Checking {user} against {users} and {roles}")
+    if not roles and not users:
+        return True
+    role_matched = (
+        require_user_in_roles(roles, raise_exception=False)(user) if roles else False
+    )
+    user_matched = (
+        require_specific_user(users, raise_exception=False)(user) if users else False
+    )
+    return role_matched or user_matched
+
+
 def user_or_role_check(
     roles: Optional[List[str]] = None, users: Optional[List[str]] = None
 ):
     def _check(user: dict = Depends(get_current_user)):
-        logger.info(f"Checking {user} against {users} and {roles}")
-        # Check roles and users without raising an exception immediately
-        role_matched = (
-            require_user_in_roles(roles, raise_exception=False)(user) if roles else True
-        )
-        user_matched = (
-            require_specific_user(users, raise_exception=False)(user) if users else True
-        )
-
         # If neither roles nor users match, raise an exception
-        if not (role_matched or user_matched):
+        with span("policy"):
+            is_authorised = is_user_authorised(user, roles=roles, users=users)
+        if not is_authorised:
             logger.info(f"User {user.get('email')} not authorised for route.")
             raise HTTPException(status_code=403, detail="Unauthorized")
 
@@ -133,7 +149,10 @@ def load_config(config: str) -> ProxyConfig:
 
 
 def proxy_route_factory(
-    uri_rule: URIRule, upstream_url: str, replacements: List[tuple] | None
+    uri_rule: URIRule,
+    upstream_url: str,
+    replacements: List[tuple] | None,
+    http2: bool = False,
 ) -> Callable:
     async def route(
         request: Request,
@@ -142,18 +161,35 @@ def proxy_route_factory(
         logger.debug(f"uri_rule: {uri_rule}")
         logger.debug(f"upstream_url: {upstream_url}")
         # Replace the wildcard in the uri with the captured path segment
-        return await transparent_proxy(upstream_url, request, replacements=replacements)
+        return await transparent_proxy(
+            upstream_url, request, replacements=replacements, http2=http2
+        )
 
     return route
 
 
+def route_path(upstream: Upstream, uri: str) -> str:
+    """Build the gatekeeper path under which an upstream uri is exposed."""
+    path = f"/{upstream.slug}{uri}"
+    return path.replace(
+        "/*", "/{path:path}"
+    )  # replace wildcard with FastAPI path parameter
+
+
+def match_uri_rule(config: ProxyConfig, path: str, method: str) -> Optional[URIRule]:
+    """Find the rule protecting `path` for `method`, mirroring `add_routes`."""
+    for upstream in config.upstreams:
+        for uri, uri_rule in upstream.uris.items():
+            path_regex, _, _ = compile_path(route_path(upstream, uri))
+            if path_regex.match(path) and method.upper() in (uri_rule.methods or []):
+                return uri_rule
+    return None
+
+
 def add_routes(app: FastAPI, config: ProxyConfig):
     for upstream in config.upstreams:
         for uri, uri_rule in upstream.uris.items():
-            path = f"/{upstream.slug}{uri}"
-            path = path.replace(
-                "/*", "/{path:path}"
-            )  # replace wildcard with FastAPI path parameter
+            path = route_path(upstream, uri)
 
             logger.info(f"Adding protected route: {path} {uri}, {uri_rule}")
 
@@ -161,7 +197,10 @@ def add_routes(app: FastAPI, config: ProxyConfig):
             app.add_api_route(
                 path=path,
                 endpoint=proxy_route_factory(
-                    uri_rule, upstream.url, replacements=[(f"/{upstream.slug}", "")]
+                    uri_rule,
+                    upstream.url,
+                    replacements=[(f"/{upstream.slug}", "")],
+                    http2=upstream.http2,
                 ),  # Pass the original uri here
                 methods=uri_rule.methods,
                 tags=[upstream.slug or upstream.url],
@@ -0,0 +1,180 @@
+# forward_auth.py
+"""
+Auth-only mode for edge proxies.
+
+Rather than streaming every byte through `transparent_proxy`, an edge proxy
+(nginx `auth_request`, Traefik `forwardAuth`) asks `/_auth` whether the
+original request is allowed and serves the body itself. The original uri and
+method are taken from the `X-Forwarded-*` (or nginx `X-Original-*`) headers.
+"""
+import hashlib
+import posixpath
+import time
+from collections import OrderedDict
+from urllib.parse import quote, unquote
+
+from fastapi import FastAPI, HTTPException, Request, Response
+from loguru import logger
+from starlette.concurrency import run_in_threadpool
+
+from app.custom_routes import ProxyConfig, is_user_authorised, match_uri_rule
+from app.tracing import span
+from app.user_auth import get_current_user
+
+SESSION_COOKIE = "session"  # SessionMiddleware default cookie name
+
+# Status code and identity headers. Cached instead of the `Response` itself as
+# middleware (e.g. sessions) appends to a response's headers when sending.
+Decision = tuple[int, dict[str, str]]
+
+
+class DecisionCache:
+    """Small TTL/LRU cache of authorisation decisions per credential and path."""
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: OrderedDict[tuple, tuple[float, Decision]] = OrderedDict()
+
+    def get(self, key: tuple) -> Decision | None:
+        if self.ttl <= 0:
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, decision = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return decision
+
+    def set(self, key: tuple, decision: Decision):
+        if self.ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, decision)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+def get_optional_user(request: Request) -> dict | None:
+    """Like `get_current_user` but returns None instead of raising a 401."""
+    try:
+        return get_current_user(request)
+    except HTTPException:
+        return None
+
+
+def credential_key(request: Request) -> str | None:
+    """Fingerprint the credentials presented so decisions can be cached."""
+    credential = request.headers.get("authorization") or request.cookies.get(
+        SESSION_COOKIE
+    )
+    if not credential:
+        return None
+    return hashlib.sha256(credential.encode("utf-8")).hexdigest()
+
+
+def normalise_path(uri: str) -> str:
+    """Decode and resolve a raw request uri to the path the edge proxy serves.
+
+    The edge proxy may forward the uri as the client sent it (e.g. nginx's
+    `$request_uri`) but normalises it itself before picking what to serve, so
+    `/pub/../admin` and `/pub/%2e%2e/admin` must be matched as `/admin`.
+    """
+    path = unquote(uri.split("?", 1)[0].split("#", 1)[0])
+    # Prefix a single "/" so `normpath` doesn't keep a leading "//".
+    normalised = posixpath.normpath("/" + path.lstrip("/"))
+    if path.endswith("/") and normalised != "/":
+        normalised += "/"
+    return normalised
+
+
+def forwarded_request(request: Request) -> tuple[str, str]:
+    """Extract the original path and method the edge proxy is asking about."""
+    uri = (
+        request.headers.get("x-forwarded-uri")
+        or request.headers.get("x-original-uri")
+        or "/"
+    )
+    method = (
+        request.headers.get("x-forwarded-method")
+        or request.headers.get("x-original-method")
+        or "GET"
+    )
+    return normalise_path(uri), method.upper()
+
+
+def _header_value(value: str) -> str:
+    # Header values are latin-1, so percent-encode (as UTF-8) anything else.
+    return quote(value, safe=" @")
+
+
+def identity_headers(user: dict) -> dict[str, str]:
+    """Headers the edge proxy can copy onto the upstream request.
+
+    Values are percent-encoded UTF-8 and groups are comma separated.
+    """
+    headers = {
+        "X-Auth-Request-User": _header_value(user.get("name") or ""),
+        "X-Auth-Request-Email": _header_value(user.get("email") or ""),
+        "X-Auth-Request-Groups": ",".join(
+            _header_value(group) for group in user.get("groups", [])
+        ),
+    }
+    return {k: v for k, v in headers.items() if v}
+
+
+def forward_auth_factory(config: ProxyConfig, cache: DecisionCache):
+    async def forward_auth(request: Request):
+        path, method = forwarded_request(request)
+        key = credential_key(request)
+        if key is not None:
+            cached = cache.get((key, method, path))
+            if cached is not None:
+                logger.debug(f"Forward auth cache hit for {method} {path}")
+                return Response(status_code=cached[0], headers=cached[1])
+
+        # Resolve the user after the cache lookup so hits skip authentication.
+        # `get_current_user` is sync (it runs its own event loop for bearer
+        # tokens) so keep it off the main loop, as FastAPI does for dependencies.
+        user = await run_in_threadpool(get_optional_user, request)
+        if user is None:
+            # Plain 401 rather than the login redirect: nginx treats a 3xx
+            # from `auth_request` as an error.
+            return Response(status_code=401)
+
+        with span("policy", **{"http.target": path}):
+            uri_rule = match_uri_rule(config, path, method)
+            is_authorised = uri_rule is not None and is_user_authorised(
+                user, roles=uri_rule.roles, users=uri_rule.users
+            )
+        if uri_rule is None:
+            logger.info(f"Forward auth: no rule for {method} {path}. Denying.")
+            decision: Decision = (403, {})
+        elif not is_authorised:
+            logger.info(f"User {user.get('email')} not authorised for {path}.")
+            decision = (403, {})
+        else:
+            logger.info(f"User {user.get('email')} authorised for {path}.")
+            decision = (200, identity_headers(user))
+
+        if key is not None:
+            cache.set((key, method, path), decision)
+        return Response(status_code=decision[0], headers=decision[1])
+
+    return forward_auth
+
+
+def add_forward_auth(
+    app: FastAPI, config: ProxyConfig, ttl: float = 5.0, max_size: int = 10000
+):
+    logger.info(f"Adding forward auth endpoint: /_auth (cache ttl {ttl}s)")
+    app.add_api_route(
+        path="/_auth",
+        endpoint=forward_auth_factory(config, DecisionCache(ttl, max_size)),
+        methods=["GET", "HEAD"],
+        tags=["forward-auth"],
+    )
+    return app
@@ -56,6 +56,10 @@ def create_app(env: str | None = None):
     app.add_middleware(
         SessionMiddleware, secret_key=app.state.settings.SESSION_SECRET, max_age=3600
     )
+    if app.state.settings.TRACING_ENABLED:
+        from app.tracing import init_tracing
+
+        app = init_tracing(app)
 
     return configure_app(app)
 
@@ -65,11 +69,29 @@ def configure_app(app: FastAPI):
     from app.custom_routes import add_routes, load_config
     from app.exception_handlers import csrf_exception_handler, custom_exception_handler
     from app.oauth import init_oauth
+    from app.proxy import close_clients, configure_clients
+
+    settings = app.state.settings
+    configure_clients(
+        max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+        pool_timeout=settings.UPSTREAM_POOL_TIMEOUT,
+    )
 
     # Router
     app.include_router(core_router)
     config = load_config("routes.sample.yaml")
     app = add_routes(app, config)
+    if settings.FORWARD_AUTH_ENABLED:
+        from app.forward_auth import add_forward_auth
+
+        app = add_forward_auth(
+            app,
+            config,
+            ttl=settings.FORWARD_AUTH_CACHE_TTL,
+            max_size=settings.FORWARD_AUTH_CACHE_SIZE,
+        )
+    app.add_event_handler("shutdown", close_clients)
     # Adding exception handlers
     app.exception_handler(MismatchingStateError)(csrf_exception_handler)
     app.exception_handler(HTTPException)(custom_exception_handler)
@@ -1,15 +1,92 @@
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+
 from fastapi import HTTPException, Request
 from fastapi.responses import StreamingResponse
-from httpx import URL, AsyncClient
+from httpx import URL, AsyncClient, AsyncHTTPTransport, Limits, Timeout
 from loguru import logger
 from starlette.background import BackgroundTask
 from typing import List
 
+from app.tracing import TRACEPARENT, current_traceparent, span
+
+UDS_SCHEME = "unix://"
+
+# One pooled client per upstream so connections (and h2 streams) are reused.
+_clients: dict[tuple[str, bool], AsyncClient] = {}
+
+# No cap on concurrent connections by default, as when each request had its own
+# client, so long streaming downloads never queue for a connection.
+_limits = Limits(max_connections=None, max_keepalive_connections=100)
+_timeout = Timeout(5.0, pool=30.0)
+
+# Pooled clients are shared between users, so they must never keep upstream
+# `Set-Cookie`s and replay them on someone else's request.
+_NO_COOKIES = DefaultCookiePolicy(allowed_domains=[])
+
+
+def configure_clients(
+    max_connections: int | None = None,
+    max_keepalive_connections: int | None = 100,
+    pool_timeout: float | None = 30.0,
+):
+    """Set the connection limits used for upstream clients created from now on.
+
+    With `max_connections` set, requests beyond it wait up to `pool_timeout`
+    seconds for a free connection before failing.
+    """
+    global _limits, _timeout
+    _limits = Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+    )
+    _timeout = Timeout(5.0, pool=pool_timeout)
+
+
+def get_client(upstream: str, http2: bool = False) -> AsyncClient:
+    """Return the shared client for an upstream, creating it on first use.
+
+    `unix:///path.sock` upstreams are reached over a Unix domain socket.
+    With `http2`, https upstreams negotiate h2 via ALPN. Plain http and Unix
+    socket upstreams have no ALPN so use h2c with prior knowledge.
+    """
+    key = (upstream, http2)
+    if key not in _clients:
+        http1 = not (http2 and not upstream.startswith("https://"))
+        if upstream.startswith(UDS_SCHEME):
+            transport = AsyncHTTPTransport(
+                uds=upstream[len(UDS_SCHEME) :],
+                http1=http1,
+                http2=http2,
+                limits=_limits,
+            )
+            base_url = "http://localhost"
+        else:
+            transport = AsyncHTTPTransport(http1=http1, http2=http2, limits=_limits)
+            base_url = upstream
+        logger.debug(f"Creating client for {upstream} (http2={http2})")
+        _clients[key] = AsyncClient(
+            base_url=base_url,
+            transport=transport,
+            timeout=_timeout,
+            cookies=CookieJar(policy=_NO_COOKIES),
+        )
+    return _clients[key]
+
+
+async def close_clients():
+    """Close pooled upstream clients. Registered as a shutdown handler."""
+    for client in _clients.values():
+        await client.aclose()
+    _clients.clear()
+
 
 async def transparent_proxy(
-    upstream: str, request: Request, replacements: List[tuple] | None
+    upstream: str,
+    request: Request,
+    replacements: List[tuple] | None,
+    http2: bool = False,
 ):
-    client = AsyncClient(base_url=upstream)
+    client = get_client(upstream, http2=http2)
     final_url = request.url.path
     if replacements:
         for r in replacements:
@@ -19,17 +96,29 @@ async def transparent_proxy(
         query=request.url.query.encode("utf-8") if request.url.query else None,
     )
     logger.debug(f"Proxying for: {url}")
+    # Only stream a body if the client sent one, otherwise httpx adds chunked
+    # framing to bodiless requests (which h2 upstreams reject).
+    has_body = "content-length" in request.headers or (
+        "transfer-encoding" in request.headers
+    )
     tp_req = client.build_request(
         request.method,
         url=url,
         headers=request.headers.raw,
-        content=request.stream(),
+        content=request.stream() if has_body else None,
     )
     logger.debug(f"{tp_req.url}")
     # logger.debug(f"{vars(tp_req)}")  # Enable for tracing...
 
     try:
-        tp_resp = await client.send(tp_req, stream=True)
+        with span("proxy.upstream", **{"upstream": upstream}) as s:
+            traceparent = current_traceparent()
+            if traceparent:
+                tp_req.headers[TRACEPARENT] = traceparent
+            tp_resp = await client.send(tp_req, stream=True)
+            if s:
+                s.attributes["http.status_code"] = tp_resp.status_code
+                s.attributes["http.version"] = tp_resp.http_version
 
         return StreamingResponse(
             tp_resp.aiter_raw(),
@@ -7,6 +7,7 @@ from jose import JWTError, jwt
 from loguru import logger
 from httpx import AsyncClient
 
+from app.tracing import span
 from app.user_auth import get_current_user
 
 
@@ -36,13 +37,14 @@ async def _auth_with_bearer_token(request: Request, token: str):
 
     jwks_data = oauth.dex.server_metadata.get("jwks")
     if not jwks_data:
-        async with AsyncClient() as client:
-            meta = await client.get(
-                request.app.state.settings.OAUTH2_SERVER_METADATA_URL
-            )
-            meta = meta.json()
-            res = await client.get(meta.get("jwks_uri"))
-            jwks_data = res.content
+        with span("auth.jwks_fetch"):
+            async with AsyncClient() as client:
+                meta = await client.get(
+                    request.app.state.settings.OAUTH2_SERVER_METADATA_URL
+                )
+                meta = meta.json()
+                res = await client.get(meta.get("jwks_uri"))
+                jwks_data = res.content
 
     # get the at_hash so we can validate this
     # the token comes in a segmented "." string with 3 components
@@ -63,19 +65,20 @@ async def _auth_with_bearer_token(request: Request, token: str):
 
     try:
         logger.debug(f"Access Token: {access_token}")
-        decoded_token = jwt.decode(
-            token,
-            jwks_data,
-            algorithms=oauth.dex.server_metadata.get(
-                "id_token_signing_alg_values_supported"
-            ),
-            access_token=access_token,
-            options={
-                "verify_signature": True,
-                "verify_aud": False,
-                "verify_at_hash": False,
-            },  # FIXME: verify the hash...
-        )
+        with span("auth.jwt_decode"):
+            decoded_token = jwt.decode(
+                token,
+                jwks_data,
+                algorithms=oauth.dex.server_metadata.get(
+                    "id_token_signing_alg_values_supported"
+                ),
+                access_token=access_token,
+                options={
+                    "verify_signature": True,
+                    "verify_aud": False,
+                    "verify_at_hash": False,
+                },  # FIXME: verify the hash...
+            )
     except JWTError as e:
         logger.error(e)
         raise HTTPException(status_code=401, detail="Token signature is invalid")
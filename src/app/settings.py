@@ -21,6 +21,23 @@ class Settings(BaseSettings):
     OAUTH2_SERVER_METADATA_URL: str
     OAUTH2_SCOPES: str = "openid profile email groups offline_access"  # offline_access for refresh tokens
 
+    # Pooled upstream connections, per upstream
+    UPSTREAM_MAX_CONNECTIONS: int | None = None  # unlimited
+    UPSTREAM_MAX_KEEPALIVE_CONNECTIONS: int | None = 100
+    UPSTREAM_POOL_TIMEOUT: float | None = 30.0  # wait for a free connection
+
+    # Forward auth mode (`/_auth` for nginx auth_request / Traefik forwardAuth)
+    FORWARD_AUTH_ENABLED: bool = False
+    FORWARD_AUTH_CACHE_TTL: float = 5.0  # seconds, 0 disables the cache
+    FORWARD_AUTH_CACHE_SIZE: int = 10000
+
+    # Tracing of the auth, policy and proxy stages per request
+    TRACING_ENABLED: bool = False
+    TRACING_SAMPLE_RATE: float = 0.0  # head-based, 0.0 - 1.0
+    TRACING_SLOW_THRESHOLD_MS: float = 1000.0  # always captured, 0 disables
+    TRACING_TRUST_PARENT_SAMPLED: bool = False  # honour incoming sampled flag
+    TRACING_FILE: str | None = None  # JSON lines sink, in-memory if unset
+
     # Pydantic meta
     # https://docs.pydantic.dev/dev-v2/usage/model_config/
     model_config = ConfigDict(
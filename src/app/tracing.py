@@ -0,0 +1,288 @@
+# tracing.py
+"""
+Lightweight per-request tracing across the auth, policy and proxy stages.
+
+A W3C `traceparent` is extracted from incoming requests (or a new trace is
+started) and propagated to upstreams. Stages are timed with `span(...)` and
+finished traces are handed to a sink. Sampling is decided at the head of the
+request; unsampled requests are still timed when a slow threshold is set so
+outliers can always be captured with their stage breakdown.
+"""
+import json
+import queue
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, Iterator, Protocol
+
+from loguru import logger
+
+TRACEPARENT = "traceparent"
+# version-trace_id-parent_id-flags, with extra fields allowed for future versions
+_TRACEPARENT_RE = re.compile(
+    r"([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})(-\S*)?"
+)
+
+
+@dataclass(slots=True)
+class Span:
+    """A timed stage of a request."""
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str | None
+    start: float  # epoch seconds
+    duration_ms: float = 0.0
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+
+class Trace:
+    """The spans recorded for a single request."""
+
+    def __init__(self, trace_id: str, sampled: bool, recording: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.recording = recording  # time stages even if not sampled
+        self.spans: list[Span] = []
+
+
+_current_trace: ContextVar[Trace | None] = ContextVar("trace", default=None)
+_current_span: ContextVar[Span | None] = ContextVar("span", default=None)
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"  # nosec: B311
+
+
+def parse_traceparent(value: str | None) -> tuple[str, str, bool] | None:
+    """Parse a `traceparent` into (trace id, parent span id, sampled).
+
+    Returns None for anything that isn't a valid W3C trace context header, in
+    which case a new trace should be started.
+    """
+    if not value:
+        return None
+    match = _TRACEPARENT_RE.fullmatch(value.strip(" \t"))
+    if not match:
+        return None
+    version, trace_id, parent_id, flags, extra = match.groups()
+    if version == "ff" or (version == "00" and extra is not None):
+        return None
+    if trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 0x01)
+
+
+def current_traceparent() -> str | None:
+    """The `traceparent` to send upstream from the current span, if tracing."""
+    trace = _current_trace.get()
+    span = _current_span.get()
+    if trace is None or span is None:
+        return None
+    return f"00-{trace.trace_id}-{span.span_id}-{'01' if trace.sampled else '00'}"
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span | None]:
+    """Time a stage of the current request. A no-op when it isn't recording."""
+    trace = _current_trace.get()
+    if trace is None or not trace.recording:
+        yield None
+        return
+    parent = _current_span.get()
+    current = Span(
+        name=name,
+        trace_id=trace.trace_id,
+        span_id=_new_id(64),
+        parent_id=parent.span_id if parent else None,
+        start=time.time(),
+        attributes=attributes,
+    )
+    token = _current_span.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    except Exception as e:
+        current.attributes["error"] = repr(e)
+        raise
+    finally:
+        current.duration_ms = (time.perf_counter() - started) * 1000
+        _current_span.reset(token)
+        trace.spans.append(current)
+
+
+# ===
+# Sinks
+# ===
+class TraceSink(Protocol):
+    def export(self, spans: list[Span]):
+        ...
+
+
+class InMemorySink:
+    """Keep the most recent traces in memory."""
+
+    def __init__(self, max_traces: int = 1000):
+        self.traces: deque[list[Span]] = deque(maxlen=max_traces)
+
+    def export(self, spans: list[Span]):
+        self.traces.append(spans)
+
+
+class FileSink:
+    """Append traces to a file as JSON lines, one trace per line.
+
+    Traces are queued and written by a background thread so exporting never
+    blocks the event loop. If the writer falls `max_queued` traces behind,
+    further traces are dropped rather than buffered.
+    """
+
+    def __init__(self, path: str, max_queued: int = 10000):
+        self.path = path
+        self.dropped = 0
+        self._queue: queue.Queue[list[Span] | None] = queue.Queue(max_queued)
+        self._writer = threading.Thread(
+            target=self._write, name="trace-file-sink", daemon=True
+        )
+        self._writer.start()
+
+    def export(self, spans: list[Span]):
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """Write out queued traces and stop the writer."""
+        self._queue.put(None)
+        self._writer.join()
+
+    def _write(self):
+        with open(self.path, "a") as file:
+            while True:
+                spans = self._queue.get()
+                if spans is None:
+                    break
+                line = json.dumps({"spans": [asdict(s) for s in spans]}, default=str)
+                file.write(line + "\n")
+                if self._queue.empty():
+                    file.flush()
+
+
+# ===
+# Middleware
+# ===
+class TracingMiddleware:
+    """Start a trace for every http request and export it when finished."""
+
+    def __init__(
+        self,
+        app,
+        sink: TraceSink,
+        sample_rate: float = 0.0,
+        slow_threshold_ms: float = 0.0,
+        trust_parent_sampled: bool = False,
+    ):
+        self.app = app
+        self.sink = sink
+        self.sample_rate = sample_rate
+        self.slow_threshold_ms = slow_threshold_ms
+        # Otherwise any client could force sampling with a `-01` traceparent.
+        self.trust_parent_sampled = trust_parent_sampled
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        traceparent = None
+        for key, value in scope["headers"]:
+            if key == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        parent = parse_traceparent(traceparent)
+        if parent:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id, sampled = _new_id(128), None, False
+        if not (parent and self.trust_parent_sampled):
+            sampled = random.random() < self.sample_rate  # nosec: B311
+        trace = Trace(trace_id, sampled, sampled or self.slow_threshold_ms > 0)
+        root = Span(
+            name="request",
+            trace_id=trace_id,
+            span_id=_new_id(64),
+            parent_id=parent_id,
+            start=time.time(),
+            attributes={"http.method": scope["method"], "http.target": scope["path"]},
+        )
+
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                root.attributes["http.status_code"] = message["status"]
+                root.attributes["time_to_headers_ms"] = (
+                    time.perf_counter() - started
+                ) * 1000
+            await send(message)
+
+        trace_token = _current_trace.set(trace)
+        span_token = _current_span.set(root)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            root.duration_ms = (time.perf_counter() - started) * 1000
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+            if trace.recording:
+                self._finish(trace, root)
+
+    def _finish(self, trace: Trace, root: Span):
+        # Streaming a large body isn't covered by any stage, so only the time
+        # until the response starts counts towards the slow threshold.
+        elapsed_ms = root.attributes.get("time_to_headers_ms", root.duration_ms)
+        slow = 0 < self.slow_threshold_ms <= elapsed_ms
+        if not (trace.sampled or slow):
+            return
+        if slow:
+            root.attributes["slow"] = True
+            stages = ", ".join(f"{s.name}={s.duration_ms:.1f}ms" for s in trace.spans)
+            logger.warning(
+                f"Slow request {root.attributes['http.method']} "
+                f"{root.attributes['http.target']} took {elapsed_ms:.1f}ms to "
+                f"respond (trace {trace.trace_id}): {stages or 'no stages recorded'}"
+            )
+        try:
+            self.sink.export([root, *trace.spans])
+        except Exception as e:
+            logger.exception(e)
+
+
+def init_tracing(app):
+    """Add tracing middleware to the app based on its settings."""
+    settings = app.state.settings
+    if settings.TRACING_FILE:
+        sink: TraceSink = FileSink(settings.TRACING_FILE)
+    else:
+        sink = InMemorySink()
+    app.state.trace_sink = sink
+    if isinstance(sink, FileSink):
+        app.add_event_handler("shutdown", sink.close)
+    app.add_middleware(
+        TracingMiddleware,
+        sink=sink,
+        sample_rate=settings.TRACING_SAMPLE_RATE,
+        slow_threshold_ms=settings.TRACING_SLOW_THRESHOLD_MS,
+        trust_parent_sampled=settings.TRACING_TRUST_PARENT_SAMPLED,
+    )
+    logger.debug(
+        f"Tracing enabled (sample rate {settings.TRACING_SAMPLE_RATE}, "
+        f"slow threshold {settings.TRACING_SLOW_THRESHOLD_MS}ms)"
+    )
+    return app
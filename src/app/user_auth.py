@@ -3,21 +3,26 @@ import asyncio
 from fastapi import HTTPException, Depends, Request
 from loguru import logger
 
+from app.tracing import span
+
 
 def get_current_user(request: Request):
     """Retrieve the current user from the session."""
-    user = request.session.get("user")
-    if not user:
-        # check if we've got a bearer token in the headers
-        payload = asyncio.run(request.app.state.oauth2_scheme(request))
-        if payload:
-            logger.info(f"OAuth2PasswordBearer: {payload}")
-            # authenticate them with the bearer, use `/auth` directly
-            from app.routes import _auth_with_bearer_token
-
-            user = asyncio.run(_auth_with_bearer_token(request, payload))
-        else:
-            raise HTTPException(status_code=401, detail="Not authenticated")
+    with span("auth.get_current_user", **{"auth.method": "session"}) as s:
+        user = request.session.get("user")
+        if not user:
+            # check if we've got a bearer token in the headers
+            payload = asyncio.run(request.app.state.oauth2_scheme(request))
+            if payload:
+                logger.info(f"OAuth2PasswordBearer: {payload}")
+                if s:
+                    s.attributes["auth.method"] = "bearer"
+                # authenticate them with the bearer, use `/auth` directly
+                from app.routes import _auth_with_bearer_token
+
+                user = asyncio.run(_auth_with_bearer_token(request, payload))
+            else:
+                raise HTTPException(status_code=401, detail="Not authenticated")
     return user
 
 
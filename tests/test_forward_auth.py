@@ -0,0 +1,266 @@
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.security import OAuth2PasswordBearer
+from fastapi.testclient import TestClient
+from starlette.middleware.sessions import SessionMiddleware
+
+from app import forward_auth
+from app.custom_routes import ProxyConfig, is_user_authorised, match_uri_rule
+from app.forward_auth import (
+    DecisionCache,
+    add_forward_auth,
+    credential_key,
+    identity_headers,
+    normalise_path,
+)
+
+CREW = {"name": "Bender", "email": "bender@planetexpress.com", "groups": ["ship_crew"]}
+ADMIN = {
+    "name": "Professor",
+    "email": "professor@planetexpress.com",
+    "groups": ["admin_staff"],
+}
+
+
+@pytest.fixture
+def config() -> ProxyConfig:
+    return ProxyConfig(
+        upstreams=[
+            {
+                "url": "http://public.local",
+                "slug": "pub",
+                "uris": {"/*": {"methods": ["GET"]}},
+            },
+            {
+                "url": "http://admin.local",
+                "slug": "admin",
+                "uris": {"/*": {"methods": ["GET"], "roles": ["admin_staff"]}},
+            },
+            {
+                "url": "http://service.local",
+                "slug": "svc",
+                "uris": {
+                    "/items": {"methods": ["GET"]},
+                    "/write": {"methods": ["POST"], "roles": ["admin_staff"]},
+                },
+            },
+        ]
+    )
+
+
+@pytest.fixture
+def app(config: ProxyConfig) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(SessionMiddleware, secret_key="test")  # nosec: B106
+    app.state.oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+
+    @app.post("/test-login")
+    async def test_login(request: Request, user: dict):
+        request.session["user"] = user
+        return {}
+
+    return add_forward_auth(app, config, ttl=60)
+
+
+@pytest.fixture
+def client(app: FastAPI) -> TestClient:
+    return TestClient(app)
+
+
+def login(client: TestClient, user: dict) -> TestClient:
+    client.post("/test-login", json=user)
+    return client
+
+
+def check(client: TestClient, uri: str, method: str = "GET", **headers):
+    return client.get(
+        "/_auth",
+        headers={"X-Original-URI": uri, "X-Original-Method": method, **headers},
+    )
+
+
+# ===
+# Paths and rules
+# ===
+@pytest.mark.parametrize(
+    "uri, expected",
+    [
+        ("/admin/x", "/admin/x"),
+        ("/admin/x/", "/admin/x/"),
+        ("/admin/x?next=/pub", "/admin/x"),
+        ("/pub/../admin/x", "/admin/x"),
+        ("/pub/%2e%2e/admin/x", "/admin/x"),
+        ("/pub/%2E%2E%2fadmin/x", "/admin/x"),
+        ("//admin/x", "/admin/x"),
+        ("/pub//../admin/x", "/admin/x"),
+        ("/../../admin/x", "/admin/x"),
+        ("", "/"),
+    ],
+)
+def test_normalise_path(uri, expected):
+    assert normalise_path(uri) == expected
+
+
+def test_match_uri_rule_depends_on_method(config: ProxyConfig):
+    assert match_uri_rule(config, "/svc/items", "GET") is not None
+    assert match_uri_rule(config, "/svc/items", "POST") is None
+    assert match_uri_rule(config, "/svc/write", "post").roles == ["admin_staff"]
+    assert match_uri_rule(config, "/svc/other", "GET") is None
+
+
+# ===
+# /_auth
+# ===
+def test_unauthenticated_is_401(client: TestClient):
+    assert check(client, "/pub/x").status_code == 401
+
+
+def test_authorised_user_gets_identity_headers(client: TestClient):
+    res = check(login(client, ADMIN), "/admin/x")
+    assert res.status_code == 200
+    assert res.headers["X-Auth-Request-User"] == "Professor"
+    assert res.headers["X-Auth-Request-Email"] == "professor@planetexpress.com"
+    assert res.headers["X-Auth-Request-Groups"] == "admin_staff"
+
+
+def test_unauthorised_user_is_403(client: TestClient):
+    login(client, CREW)
+    assert check(client, "/admin/x").status_code == 403
+    assert check(client, "/pub/x").status_code == 200
+
+
+def test_no_matching_rule_is_403(client: TestClient):
+    assert check(login(client, ADMIN), "/unknown/x").status_code == 403
+
+
+def test_method_is_part_of_the_decision(client: TestClient):
+    login(client, ADMIN)
+    assert check(client, "/svc/write", "POST").status_code == 200
+    assert check(client, "/svc/write", "GET").status_code == 403
+    assert check(client, "/svc/items", "POST").status_code == 403
+
+
+@pytest.mark.parametrize(
+    "uri",
+    [
+        "/pub/../admin/x",
+        "/pub/%2e%2e/admin/x",
+        "/pub/%2E%2E/admin/x",
+        "/pub/..%2fadmin/x",
+        "/pub/%2e%2e%2fadmin/x",
+        "//admin/x",
+    ],
+)
+def test_traversal_is_matched_as_the_normalised_path(client: TestClient, uri):
+    login(client, CREW)
+    assert check(client, uri).status_code == 403
+
+
+def test_forwarded_headers_take_precedence(client: TestClient):
+    login(client, CREW)
+    res = client.get(
+        "/_auth",
+        headers={"X-Forwarded-Uri": "/admin/x", "X-Original-URI": "/pub/x"},
+    )
+    assert res.status_code == 403
+
+
+def test_non_latin1_identity_is_encoded(client: TestClient):
+    user = {"name": "Zoë 张", "email": "zoe@example.com", "groups": ["crew,张"]}
+    res = check(login(client, user), "/pub/x")
+    assert res.status_code == 200
+    assert res.headers["X-Auth-Request-User"] == "Zo%C3%AB %E5%BC%A0"
+    assert res.headers["X-Auth-Request-Groups"] == "crew%2C%E5%BC%A0"
+
+
+def test_identity_headers_skip_missing_values():
+    assert identity_headers({"email": "a@b.c"}) == {"X-Auth-Request-Email": "a@b.c"}
+
+
+# ===
+# Caching
+# ===
+def test_denied_decision_is_served_from_cache(client: TestClient, config: ProxyConfig):
+    login(client, CREW)
+    assert check(client, "/admin/x").status_code == 403
+    # Loosen the rule: the cached denial is still served until it expires.
+    config.upstreams[1].uris["/*"].roles = []
+    assert check(client, "/admin/x").status_code == 403
+    assert check(client, "/admin/y").status_code == 200
+
+
+def test_401_is_never_cached(client: TestClient, monkeypatch):
+    users = iter([None, ADMIN])
+    monkeypatch.setattr(forward_auth, "get_optional_user", lambda request: next(users))
+    headers = {"Authorization": "Bearer token"}
+    assert check(client, "/admin/x", **headers).status_code == 401
+    assert check(client, "/admin/x", **headers).status_code == 200
+
+
+def test_cache_is_keyed_per_credential(client: TestClient, monkeypatch):
+    users = iter([ADMIN, CREW])
+    monkeypatch.setattr(forward_auth, "get_optional_user", lambda request: next(users))
+    assert check(client, "/admin/x", Authorization="Bearer a").status_code == 200
+    assert check(client, "/admin/x", Authorization="Bearer b").status_code == 403
+
+
+def test_decision_cache_expires(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(forward_auth.time, "monotonic", lambda: now[0])
+    cache = DecisionCache(ttl=5, max_size=10)
+    cache.set(("k",), (200, {}))
+    now[0] += 4.9
+    assert cache.get(("k",)) == (200, {})
+    now[0] += 0.2
+    assert cache.get(("k",)) is None
+
+
+def test_decision_cache_evicts_least_recently_used():
+    cache = DecisionCache(ttl=5, max_size=2)
+    cache.set(("a",), (200, {}))
+    cache.set(("b",), (403, {}))
+    assert cache.get(("a",)) is not None  # "b" is now the oldest
+    cache.set(("c",), (200, {}))
+    assert cache.get(("b",)) is None
+    assert cache.get(("a",)) is not None
+    assert cache.get(("c",)) is not None
+
+
+def test_decision_cache_disabled_with_zero_ttl():
+    cache = DecisionCache(ttl=0, max_size=2)
+    cache.set(("a",), (200, {}))
+    assert cache.get(("a",)) is None
+
+
+def test_credential_key(client: TestClient):
+    def key(**headers):
+        request = Request(
+            {
+                "type": "http",
+                "headers": [
+                    (k.lower().encode(), v.encode()) for k, v in headers.items()
+                ],
+            }
+        )
+        return credential_key(request)
+
+    assert key() is None
+    assert key(Authorization="Bearer a") != key(Authorization="Bearer b")
+    assert key(Cookie="session=abc") == key(Cookie="session=abc; other=1")
+    assert key(Cookie="other=1") is None
+    assert "abc" not in key(Cookie="session=abc")
+
+
+@pytest.mark.parametrize(
+    "roles, users, expected",
+    [
+        ([], [], True),
+        (["admin_staff"], [], False),
+        ([], ["someone@example.com"], False),
+        ([], ["bender@planetexpress.com"], True),
+        (["admin_staff"], ["bender@planetexpress.com"], True),
+        (["ship_crew"], ["someone@example.com"], True),
+    ],
+)
+def test_is_user_authorised(roles, users, expected):
+    assert is_user_authorised(CREW, roles=roles, users=users) is expected
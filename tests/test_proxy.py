@@ -0,0 +1,146 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app import proxy
+from app.proxy import close_clients, configure_clients, get_client, transparent_proxy
+
+UPSTREAM = "http://upstream.local"
+
+
+class Body(httpx.AsyncByteStream):
+    """A response body that can still be streamed, unlike `content=`."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def __aiter__(self):
+        yield self.data
+
+
+def echo(request: httpx.Request) -> httpx.Response:
+    """A stand-in upstream that sets a cookie on login and echoes requests."""
+    if request.url.path == "/login":
+        cookie = {"set-cookie": "app_session=ALICE-SECRET; Path=/"}
+        return httpx.Response(200, headers=cookie, stream=Body(b""))
+    received = {
+        "method": request.method,
+        "headers": dict(request.headers),
+        "body": request.content.decode(),
+    }
+    return httpx.Response(200, stream=Body(json.dumps(received).encode()))
+
+
+class FakeTransport(httpx.MockTransport):
+    """Records how `get_client` configured the transport."""
+
+    def __init__(self, **kwargs):
+        super().__init__(echo)
+        self.kwargs = kwargs
+
+
+@pytest.fixture(autouse=True)
+def transport(monkeypatch):
+    monkeypatch.setattr(proxy, "AsyncHTTPTransport", FakeTransport)
+    # configure_clients() mutates these; monkeypatch restores them afterwards.
+    monkeypatch.setattr(proxy, "_limits", proxy._limits)
+    monkeypatch.setattr(proxy, "_timeout", proxy._timeout)
+    yield
+    asyncio.run(close_clients())
+
+
+@pytest.fixture
+def app() -> FastAPI:
+    app = FastAPI()
+
+    @app.api_route("/app/{path:path}", methods=["GET", "POST"])
+    async def route(request: Request):
+        return await transparent_proxy(UPSTREAM, request, [("/app", "")])
+
+    return app
+
+
+# ===
+# Clients
+# ===
+def test_unix_socket_upstream_uses_uds_transport():
+    client = get_client("unix:///run/upstream.sock")
+    assert client._transport.kwargs["uds"] == "/run/upstream.sock"
+    assert client.base_url == "http://localhost"
+
+
+@pytest.mark.parametrize("upstream", [UPSTREAM, "https://upstream.local"])
+def test_tcp_upstream_uses_its_url(upstream):
+    client = get_client(upstream)
+    assert "uds" not in client._transport.kwargs
+    assert client.base_url == upstream
+
+
+@pytest.mark.parametrize(
+    "upstream, http2, http1_enabled",
+    [
+        (UPSTREAM, False, True),
+        ("https://upstream.local", False, True),
+        ("unix:///run/upstream.sock", False, True),
+        # h2c prior knowledge: without ALPN there's nothing to negotiate with.
+        (UPSTREAM, True, False),
+        ("unix:///run/upstream.sock", True, False),
+        # https negotiates h2 via ALPN, falling back to HTTP/1.1.
+        ("https://upstream.local", True, True),
+    ],
+)
+def test_http_version_flags(upstream, http2, http1_enabled):
+    kwargs = get_client(upstream, http2=http2)._transport.kwargs
+    assert kwargs["http1"] is http1_enabled
+    assert kwargs["http2"] is http2
+
+
+def test_clients_are_reused_per_upstream_and_http_version():
+    client = get_client(UPSTREAM)
+    assert get_client(UPSTREAM) is client
+    assert get_client(UPSTREAM, http2=True) is not client
+    assert get_client("http://other.local") is not client
+
+
+def test_configure_clients_sets_limits_for_new_clients():
+    configure_clients(max_connections=10, max_keepalive_connections=5, pool_timeout=1)
+    client = get_client(UPSTREAM)
+    limits = client._transport.kwargs["limits"]
+    assert (limits.max_connections, limits.max_keepalive_connections) == (10, 5)
+    assert client.timeout.pool == 1
+
+
+def test_close_clients_clears_the_pool():
+    client = get_client(UPSTREAM)
+    asyncio.run(close_clients())
+    assert client.is_closed
+    assert get_client(UPSTREAM) is not client
+
+
+# ===
+# Proxying
+# ===
+def test_bodiless_request_is_not_chunked(app: FastAPI):
+    received = TestClient(app).get("/app/x").json()
+    assert received["method"] == "GET"
+    assert "transfer-encoding" not in received["headers"]
+    assert "content-length" not in received["headers"]
+
+
+def test_request_body_is_forwarded(app: FastAPI):
+    received = TestClient(app).post("/app/x", content=b"payload").json()
+    assert received["body"] == "payload"
+    assert received["headers"]["content-length"] == "7"
+
+
+def test_upstream_cookies_are_not_shared_between_requests(app: FastAPI):
+    alice = TestClient(app)
+    assert "app_session" in alice.get("/app/login").cookies
+    # Another user's request without a Cookie header gets none from the pool.
+    carol = TestClient(app)
+    received = carol.get("/app/whoami", headers={"Authorization": "Bearer c"}).json()
+    assert "cookie" not in received["headers"]
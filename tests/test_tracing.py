@@ -0,0 +1,195 @@
+import asyncio
+import json
+import threading
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app import tracing
+from app.tracing import (
+    FileSink,
+    InMemorySink,
+    TracingMiddleware,
+    current_traceparent,
+    parse_traceparent,
+    span,
+)
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+# ===
+# traceparent
+# ===
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (f"00-{TRACE_ID}-{PARENT_ID}-01", (TRACE_ID, PARENT_ID, True)),
+        (f"00-{TRACE_ID}-{PARENT_ID}-00", (TRACE_ID, PARENT_ID, False)),
+        (f"00-{TRACE_ID}-{PARENT_ID}-09", (TRACE_ID, PARENT_ID, True)),
+        (f" 00-{TRACE_ID}-{PARENT_ID}-01 ", (TRACE_ID, PARENT_ID, True)),
+        # Future versions may append fields.
+        (f"01-{TRACE_ID}-{PARENT_ID}-01-extra", (TRACE_ID, PARENT_ID, True)),
+        (f"cc-{TRACE_ID}-{PARENT_ID}-00", (TRACE_ID, PARENT_ID, False)),
+    ],
+)
+def test_parse_traceparent_valid(value, expected):
+    assert parse_traceparent(value) == expected
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        None,
+        "",
+        "garbage",
+        "00-" + "z" * 32 + "-" + "g" * 16 + "-01",
+        f"00-{TRACE_ID.upper()}-{PARENT_ID}-01",
+        f"00-{TRACE_ID}-{PARENT_ID.upper()}-01",
+        f"00-{TRACE_ID}-{PARENT_ID}-0g",
+        f"00-{TRACE_ID}-{PARENT_ID}-01-extra",
+        f"ff-{TRACE_ID}-{PARENT_ID}-01",
+        f"0-{TRACE_ID}-{PARENT_ID}-01",
+        f"00-{TRACE_ID[:-1]}-{PARENT_ID}-01",
+        f"00-{TRACE_ID}-{PARENT_ID}0-01",
+        f"00-{'0' * 32}-{PARENT_ID}-01",
+        f"00-{TRACE_ID}-{'0' * 16}-01",
+        f"00-{TRACE_ID}-{PARENT_ID}-01\n",
+    ],
+)
+def test_parse_traceparent_invalid(value):
+    assert parse_traceparent(value) is None
+
+
+# ===
+# Middleware
+# ===
+def make_client(**kwargs) -> tuple[TestClient, InMemorySink]:
+    app = FastAPI()
+    sink = InMemorySink()
+    app.add_middleware(TracingMiddleware, sink=sink, **kwargs)
+
+    @app.get("/")
+    async def index(request: Request):
+        with span("stage", step=1):
+            propagated = current_traceparent()
+        return {"traceparent": propagated}
+
+    @app.get("/download")
+    async def download():
+        async def body():
+            yield b"first chunk"
+            await asyncio.sleep(0.2)
+            yield b"last chunk"
+
+        return StreamingResponse(body())
+
+    return TestClient(app), sink
+
+
+def test_sampled_request_is_exported_with_stages():
+    client, sink = make_client(sample_rate=1.0)
+    propagated = client.get("/").json()["traceparent"]
+    (trace,) = sink.traces
+    root, stage = trace
+    assert root.name == "request" and root.attributes["http.status_code"] == 200
+    assert stage.name == "stage" and stage.parent_id == root.span_id
+    assert stage.attributes == {"step": 1}
+    assert propagated == f"00-{root.trace_id}-{stage.span_id}-01"
+
+
+def test_unsampled_request_is_not_exported():
+    client, sink = make_client(sample_rate=0.0)
+    propagated = client.get("/").json()["traceparent"]
+    assert not sink.traces
+    assert propagated.endswith("-00")
+
+
+def test_slow_request_is_always_exported():
+    client, sink = make_client(sample_rate=0.0, slow_threshold_ms=1e-6)
+    client.get("/")
+    (trace,) = sink.traces
+    assert trace[0].attributes["slow"] is True
+    assert [s.name for s in trace] == ["request", "stage"]
+
+
+def test_slow_body_streaming_is_not_an_outlier():
+    client, sink = make_client(sample_rate=0.0, slow_threshold_ms=100)
+    assert client.get("/download").content == b"first chunklast chunk"
+    assert not sink.traces
+
+
+def test_time_to_headers_is_recorded_separately():
+    client, sink = make_client(sample_rate=1.0, slow_threshold_ms=100)
+    client.get("/download")
+    ((root,),) = sink.traces
+    assert root.attributes["time_to_headers_ms"] < 100 <= root.duration_ms
+    assert "slow" not in root.attributes
+
+
+def test_parent_trace_id_is_continued():
+    client, _ = make_client()
+    headers = {"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-00"}
+    propagated = client.get("/", headers=headers).json()["traceparent"]
+    assert parse_traceparent(propagated)[0] == TRACE_ID
+
+
+def test_invalid_parent_starts_new_trace():
+    client, _ = make_client()
+    headers = {"traceparent": "00-" + "z" * 32 + "-" + "g" * 16 + "-01"}
+    propagated = client.get("/", headers=headers).json()["traceparent"]
+    assert parse_traceparent(propagated) is not None
+    assert "z" * 32 not in propagated
+
+
+def test_parent_sampled_flag_is_ignored_by_default():
+    client, sink = make_client(sample_rate=0.0)
+    headers = {"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"}
+    propagated = client.get("/", headers=headers).json()["traceparent"]
+    assert not sink.traces
+    assert propagated.endswith("-00")
+
+
+def test_parent_sampled_flag_is_honoured_when_trusted():
+    client, sink = make_client(sample_rate=0.0, trust_parent_sampled=True)
+    headers = {"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"}
+    client.get("/", headers=headers)
+    (trace,) = sink.traces
+    assert trace[0].trace_id == TRACE_ID and trace[0].parent_id == PARENT_ID
+
+
+# ===
+# Sinks
+# ===
+def test_file_sink_writes_from_background_thread(tmp_path, monkeypatch):
+    writers = set()
+    real_asdict = tracing.asdict
+
+    def asdict(*args, **kwargs):
+        writers.add(threading.current_thread().name)
+        return real_asdict(*args, **kwargs)
+
+    monkeypatch.setattr(tracing, "asdict", asdict)
+    path = tmp_path / "traces.jsonl"
+    sink = FileSink(str(path))
+    client = TestClient(FastAPI())
+    client.app.add_middleware(TracingMiddleware, sink=sink, sample_rate=1.0)
+    for _ in range(3):
+        client.get("/missing")
+    sink.close()
+
+    lines = path.read_text().splitlines()
+    assert len(lines) == 3
+    assert json.loads(lines[0])["spans"][0]["attributes"]["http.status_code"] == 404
+    assert writers == {"trace-file-sink"}
+
+
+def test_file_sink_drops_when_queue_is_full(tmp_path):
+    sink = FileSink(str(tmp_path / "traces.jsonl"), max_queued=1)
+    sink.close()  # stop the writer so nothing drains the queue
+    sink.export([])
+    sink.export([])
+    assert sink.dropped == 1